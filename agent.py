@@ -1,18 +1,37 @@
-from typing import Annotated, List, Dict, Union, TypedDict, Any
-from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage, AIMessage, SystemMessage
+from typing import Annotated, AsyncIterator, List, Dict, NamedTuple, Optional, Tuple, Type, Union, TypedDict, Any
+import operator
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage, AIMessage
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph
 from langchain_core.runnables import RunnableConfig
+from langchain_community.cache import SQLiteCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps
+from pydantic import BaseModel
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
 from langsmith import traceable
 from langsmith.wrappers import wrap_openai
-from openai import OpenAI
-import json
+from openai import AsyncOpenAI
+import asyncio
+import httpx
+import orjson
+import sys
 import os
 from dotenv import load_dotenv
-from tools import linkedin_tool, hunter_tool
+from tools import (
+    linkedin_tool,
+    hunter_tool,
+    get_linkedin_profile,
+    get_hunter_data,
+    close_http_client,
+    LINKEDIN_FIELDS,
+)
 from prompts import (
     ANALYSIS_PROMPT, 
+    BATCH_ANALYSIS_PROMPT,
     PRIORITY_PROMPT,
+    OUTPUT_FORMAT_PROMPT,
     validate_llm_output,
     get_model_schema,
 )
@@ -20,281 +39,552 @@ from models import (
     SearchConfig, 
     PriorityAnalysis,
     HunterResponse,
-    User
+    User,
+    BatchProfileAnalysis,
+    PROMPT_MODELS,
+    batch_timestamp
 )
 import logging
 from langgraph.prebuilt import ToolNode, tools_condition
-from langchain.prompts import ChatPromptTemplate
+from langchain_core.prompts import ChatPromptTemplate
 from system_prompts import ANALYSIS_SYSTEM_PROMPT, PRIORITY_SYSTEM_PROMPT
 
 load_dotenv()
 
-# Konfigurer logging
+# Konfigurer logging. Biblioteks-loggere (langchain, openai, ...) arver nivået fra root
 logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
-for logger in ['langchain', 'langchain_core', 'langchain_openai', 'openai']:
-    logging.getLogger(logger).setLevel(logging.ERROR)
 
 # Configs
 DEFAULT_MODEL = "gpt-4o-mini"
 DEFAULT_TEMPERATURE = 0
+MODEL_NAME = os.getenv("MODEL_NAME", DEFAULT_MODEL)
+TEMPERATURE = float(os.getenv("TEMPERATURE", DEFAULT_TEMPERATURE))
+
+# Miljøvariabler leses én gang ved import
+HUNTER_API_KEY = os.getenv("HUNTER_API_KEY")
+
+# Hunter-paginering: sidestørrelse (maks 100 hos Hunter), maks antall sider og samtidige sidekall
+HUNTER_PAGE_LIMIT = int(os.getenv("HUNTER_PAGE_LIMIT", 100))
+HUNTER_MAX_PAGES = int(os.getenv("HUNTER_MAX_PAGES", 5))
+HUNTER_CONCURRENCY = 4
+
+# Hunter-treff under denne confidence-verdien sendes ikke videre
+MIN_CONFIDENCE = int(os.getenv("MIN_CONFIDENCE", 50))
+
+# LLM-en velger max_results brukere, så den får maks 4x så mange kandidater
+PRIORITY_CANDIDATE_FACTOR = 4
+
+# Maks antall samtidige LLM-kall per node
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 10))
+
+# Antall profiler per samlet analysekall
+ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", 5))
+
+# Cache LLM-svar på disk, delt mellom prosesser. Nøkkelen er prompt + modell/temperatur.
+# CACHE_DISABLE=1 slår av all caching (LLM og LinkedIn).
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".langchain.db")
+CACHE_DISABLED = os.getenv("CACHE_DISABLE") == "1"
+
+class LLMCache(SQLiteCache):
+    """SQLiteCache som også kan fjerne enkeltsvar"""
+    def delete(self, prompt: str, llm_string: str) -> None:
+        stmt = (
+            delete(self.cache_schema)
+            .where(self.cache_schema.prompt == prompt)
+            .where(self.cache_schema.llm == llm_string)
+        )
+        with Session(self.engine) as session, session.begin():
+            session.execute(stmt)
+
+llm_cache: Optional[LLMCache] = None
+if not CACHE_DISABLED:
+    llm_cache = LLMCache(database_path=LLM_CACHE_PATH)
+    set_llm_cache(llm_cache)
 
-# Wrap OpenAI client for better tracing
-openai_client = wrap_openai(OpenAI())
+# JSON-schemaene er konstante, så de beregnes én gang ved import
+MODEL_SCHEMAS = {model: get_model_schema(model) for model in PROMPT_MODELS}
 
-# Definer state typer
-MessageList = Annotated[List[BaseMessage], "messages"]
-UserList = Annotated[List[Dict], "users"]
+# Prompt-malene bygges én gang med schemaet ferdig utfylt, og gjenbrukes for alle kall
+PRIORITY_TEMPLATE = ChatPromptTemplate.from_messages([
+    ("system", PRIORITY_SYSTEM_PROMPT + OUTPUT_FORMAT_PROMPT),
+    ("human", PRIORITY_PROMPT)
+]).partial(model_schema=MODEL_SCHEMAS[PriorityAnalysis])
+ANALYSIS_TEMPLATE = ChatPromptTemplate.from_messages([
+    ("system", ANALYSIS_SYSTEM_PROMPT + OUTPUT_FORMAT_PROMPT),
+    ("human", ANALYSIS_PROMPT)
+]).partial(model_schema=MODEL_SCHEMAS[User])
+BATCH_ANALYSIS_TEMPLATE = ChatPromptTemplate.from_messages([
+    ("system", ANALYSIS_SYSTEM_PROMPT + OUTPUT_FORMAT_PROMPT),
+    ("human", BATCH_ANALYSIS_PROMPT)
+]).partial(model_schema=MODEL_SCHEMAS[BatchProfileAnalysis])
 
+# Felter fra Hunter og prioritering som brukes i analysen
+HUNTER_KEYS = frozenset({
+    "email", "first_name", "last_name", "role", "linkedin_url",
+    "priority_score", "priority_reason",
+})
+
+# LinkedIn-feltene er de samme som verktøyet beholder ved henting
+RELEVANT_PROFILE_KEYS = HUNTER_KEYS | LINKEDIN_FIELDS
+
+# Bilde- og logo-URLer i nestede oppføringer (erfaring, utdanning) sier ingenting om personen
+NESTED_NOISE_KEYS = frozenset({"profile_pic_url", "company_logo_url", "school_logo_url", "logo_url"})
+
+def prune_profile(user: Dict) -> Dict:
+    """Fjerner felter fra LinkedIn-data som ikke brukes i analysen"""
+    profile = {}
+    for key, value in (user | user["linkedin_raw"]).items():
+        if key not in RELEVANT_PROFILE_KEYS or value in ([], {}, "", None):
+            continue
+        if isinstance(value, list):
+            value = [
+                {k: v for k, v in item.items() if k not in NESTED_NOISE_KEYS}
+                if isinstance(item, dict) else item
+                for item in value
+            ]
+        profile[key] = value
+
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        before = len(to_prompt_json(user | user["linkedin_raw"]))
+        logging.debug("Profil for %s: %d -> %d tegn", user["email"], before, len(to_prompt_json(profile)))
+    return profile
+
+def parse_confidence(user: Dict) -> int:
+    """Confidence som tall. Hunter kan mangle verdien eller sende null, det regnes som 0"""
+    try:
+        return int(user.get("confidence") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def to_prompt_json(data: Any) -> str:
+    """Kompakt JSON for prompts - innrykk koster bare tokens"""
+    return orjson.dumps(data).decode()
+
+# Reducer for users - nodene erstatter hele listen
+def replace_users(current: List[Dict], new: List[Dict]) -> List[Dict]:
+    """Reducer for å oppdatere users i state"""
+    return new
+
+# Definer state typer. Nodene returnerer kun endringer; messages legges til
 class AgentState(TypedDict):
-    messages: Annotated[List[BaseMessage], "messages"]
-    users: Annotated[List[Dict], "users"]
+    messages: Annotated[List[BaseMessage], operator.add]
+    users: Annotated[List[Dict], replace_users]
     config: SearchConfig
 
-# Opprett LLM instans
-llm = ChatOpenAI(
-    model_name=os.getenv("MODEL_NAME", DEFAULT_MODEL),
-    temperature=float(os.getenv("TEMPERATURE", DEFAULT_TEMPERATURE))
-)
+# JSON mode: API-et garanterer gyldig JSON, schemaet står fortsatt i prompten.
+# Strict json_schema støtter ikke Dict[str, User] og valgfrie felter i modellene våre.
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
 
-# Legg til på toppen av filen, etter imports
-def add_users(state: Dict, new_state: Dict) -> Dict:
-    """Reducer for å oppdatere users i state"""
-    state["users"] = new_state.get("users", state["users"])
-    return state
+class OpenAIClients(NamedTuple):
+    """OpenAI-klientene for én event-loop, over en delt HTTP/2-klient med keep-alive"""
+    http: httpx.AsyncClient
+    openai: AsyncOpenAI
+    llm: ChatOpenAI
+
+# En httpx-klient er bundet til loopen den først brukes på, og analyze_domain
+# starter en ny loop per kall. Klientene lages derfor per loop, og lukkes av eieren
+_openai_clients: Dict[asyncio.AbstractEventLoop, OpenAIClients] = {}
+
+def get_openai_clients() -> OpenAIClients:
+    """Henter OpenAI-klientene for loopen som kjører, og lager dem ved første kall"""
+    loop = asyncio.get_running_loop()
+    # Klienter for looper som er lukket uten close_openai_clients kan ikke brukes igjen
+    for stale in [l for l in _openai_clients if l.is_closed()]:
+        del _openai_clients[stale]
+    clients = _openai_clients.get(loop)
+    if clients is None:
+        http = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=64, max_connections=128)
+        )
+        llm = ChatOpenAI(
+            model_name=MODEL_NAME,
+            temperature=TEMPERATURE,
+            http_async_client=http,
+            model_kwargs={"response_format": JSON_RESPONSE_FORMAT}
+        )
+        clients = _openai_clients[loop] = OpenAIClients(
+            http=http,
+            # Wrap OpenAI client for better tracing
+            openai=wrap_openai(AsyncOpenAI(http_client=http)),
+            llm=llm
+        )
+    return clients
+
+async def close_openai_clients() -> None:
+    """Lukker OpenAI-klientene for loopen som kjører"""
+    clients = _openai_clients.pop(asyncio.get_running_loop(), None)
+    if clients is not None:
+        await clients.http.aclose()
+
+def get_llm() -> ChatOpenAI:
+    """LLM-instansen for loopen som kjører"""
+    return get_openai_clients().llm
 
-def add_messages(state: Dict, new_state: Dict) -> Dict:
-    """Reducer for å oppdatere messages i state"""
-    state["messages"].extend(new_state.get("messages", []))
-    return state
+async def evict_cached_reply(prompt: List[BaseMessage]) -> None:
+    """Fjerner svaret på prompten fra LLM-cachen. Nøkkelen bygges som i langchain."""
+    if llm_cache is not None:
+        await asyncio.to_thread(llm_cache.delete, dumps(prompt), get_llm()._get_llm_string())
 
-# Definer state updates
-def update_state(state: Dict, new_state: Dict) -> Dict:
-    """Oppdaterer state med nye verdier"""
-    state.update(new_state)
-    return state
+async def invoke_llm(prompt: List[BaseMessage], state: AgentState, config: RunnableConfig) -> BaseMessage:
+    """Kaller LLM-en med cache.
+
+    Ber søket om ferske data, fjernes det cachede svaret først. Da hentes et
+    nytt svar, og det erstatter det gamle i cachen for senere kjøringer.
+    """
+    if state["config"].get("bypass_cache"):
+        await evict_cached_reply(prompt)
+    return await get_llm().ainvoke(prompt, config=config)
+
+async def validate_reply(
+    response: BaseMessage,
+    prompt: List[BaseMessage],
+    model_class: Type[BaseModel]
+) -> Dict[str, Any]:
+    """Validerer et LLM-svar mot modellen.
+
+    Et ugyldig svar fjernes fra LLM-cachen før feilen kastes videre, ellers
+    gjenbrukes det ved hver ny kjøring.
+    """
+    if not isinstance(response, AIMessage):
+        raise ValueError(f"Uventet respons type: {type(response)}")
+    try:
+        return validate_llm_output(response.content, model_class)
+    except ValueError:
+        await evict_cached_reply(prompt)
+        raise
 
 # SCREENING NODE
 @traceable(run_type="chain", name="hunter_collection")
-def collect_hunter_data(state: AgentState, config: RunnableConfig) -> AgentState:
-    """Henter kontakter fra Hunter.io"""
+async def collect_hunter_data(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+    """Henter kontakter fra Hunter.io, alle sider parallelt"""
+    sem = asyncio.Semaphore(HUNTER_CONCURRENCY)
+
+    # Verktøyfunksjonene kalles direkte. Argumentene har riktige typer allerede,
+    # så StructuredTool-validering per kall er unødvendig
+    async def fetch_page(offset: int) -> HunterResponse:
+        async with sem:
+            hunter_data = await get_hunter_data(
+                state["config"]["domain"],
+                HUNTER_API_KEY,
+                offset=offset,
+                limit=HUNTER_PAGE_LIMIT,
+                bypass_cache=state["config"].get("bypass_cache", False)
+            )
+        return HunterResponse.model_validate(hunter_data)
+
     try:
-        hunter_data = hunter_tool.invoke({
-            "domain": state["config"]["domain"],
-            "api_key": os.getenv("HUNTER_API_KEY")
-        })
-        
-        # Valider response med HunterResponse modell
-        validated_data = HunterResponse(**hunter_data)
-        
+        # Første side gir totalt antall treff, resten hentes samtidig
+        first_page = await fetch_page(0)
+        total = min(
+            int(first_page.meta.get("total") or 0),
+            HUNTER_MAX_PAGES * HUNTER_PAGE_LIMIT
+        )
+        pages = await asyncio.gather(
+            *(fetch_page(offset) for offset in range(HUNTER_PAGE_LIMIT, total, HUNTER_PAGE_LIMIT)),
+            return_exceptions=True
+        )
+
+        emails = list(first_page.emails)
+        page_errors = []
+        for page in pages:
+            if isinstance(page, Exception):
+                page_errors.append(
+                    ToolMessage(
+                        tool_call_id="hunter_error",
+                        tool_name="hunter",
+                        content=f"Feil ved henting av side: {str(page)}"
+                    )
+                )
+                continue
+            emails.extend(page.emails)
+
+        # E-poster normaliseres én gang her. LLM-svarene har små bokstaver, og
+        # internerte strenger gjør oppslagene per e-post i de neste nodene billige
         users = [
             {
-                "email": email["value"],
+                "email": sys.intern(email["value"].lower()),
                 "first_name": email.get("first_name"),
                 "last_name": email.get("last_name"),
                 "role": email.get("position"),
                 "linkedin_url": email.get("linkedin"),
                 "confidence": str(email.get("confidence", "")),
-                "sources": ["hunter"]
+                "sources": ("hunter",)
             }
-            for email in validated_data.emails
+            for email in emails
         ]
+
+        # Dropp treff med lav confidence og dupliserte e-poster (første treff beholdes)
+        by_email = {}
+        for user in users:
+            if parse_confidence(user) >= MIN_CONFIDENCE:
+                by_email.setdefault(user["email"], user)
+        users = list(by_email.values())
         
         return {
-            "messages": state["messages"] + [
+            "messages": page_errors + [
                 ToolMessage(
                     tool_call_id="hunter_success",
                     tool_name="hunter",
                     content=f"Hentet {len(users)} kontakter"
                 )
             ],
-            "users": users,
-            "config": state["config"]
+            "users": users
         }
     except Exception as e:
         return {
-            "messages": state["messages"] + [
+            "messages": [
                 ToolMessage(
                     tool_call_id="hunter_error",
                     tool_name="hunter",
                     content=f"Feil: {str(e)}"
                 )
             ],
-            "users": [],
-            "config": state["config"]
+            "users": []
         }
 
 # PRIORITERING NODE
 @traceable(run_type="chain", name="prioritize_users")
-def prioritize_users(state: AgentState, config: RunnableConfig) -> AgentState:
+async def prioritize_users(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
     """Prioriterer brukere basert på deres egnethet for målrollen."""
     users_with_roles = [u for u in state["users"] if u.get("role")]
     
     if not users_with_roles:
         return {
-            "messages": state["messages"] + [HumanMessage(content="Ingen brukere med roller funnet")],
-            "users": [],
-            "config": state["config"]
+            "messages": [HumanMessage(content="Ingen brukere med roller funnet")],
+            "users": []
         }
     
-    try:
-        # Formater meldinger direkte
-        messages = [
-            SystemMessage(content=PRIORITY_SYSTEM_PROMPT),
-            HumanMessage(content=PRIORITY_PROMPT.format(
-                target_role=state['config']['target_role'],
-                prospects=json.dumps(users_with_roles, indent=2),
-                available_data=json.dumps({"domain": state['config']['domain']}, indent=2),
-                model_schema=get_model_schema(PriorityAnalysis),
-                max_results=state['config'].get('max_results', 5)
-            ))
+    max_results = state['config'].get('max_results', 5)
+
+    # Alle kandidatene berikes uansett, så rangering med LLM er unødvendig
+    if len(users_with_roles) <= max_results:
+        prioritized = [
+            user | {
+                "priority_score": 1.0,
+                "priority_reason": "Færre kandidater enn max_results, ikke rangert",
+                "sources": (*user["sources"], "prioritized")
+            }
+            for user in users_with_roles
         ]
-        response = llm.invoke(messages)
-        if isinstance(response, AIMessage):
-            analysis = PriorityAnalysis(**json.loads(response.content))
-        else:
-            raise ValueError(f"Uventet respons type: {type(response)}")
+        return {
+            "messages": [
+                AIMessage(content=f"Prioriterte {len(prioritized)} brukere uten rangering")
+            ],
+            "users": prioritized
+        }
+
+    # Send kun kandidatene med høyest confidence til LLM-en
+    users_with_roles.sort(key=parse_confidence, reverse=True)
+    users_with_roles = users_with_roles[:PRIORITY_CANDIDATE_FACTOR * max_results]
+    
+    try:
+        messages = PRIORITY_TEMPLATE.format_messages(
+            target_role=state['config']['target_role'],
+            prospects=to_prompt_json(users_with_roles),
+            available_data=to_prompt_json({"domain": state['config']['domain']}),
+            max_results=max_results
+        )
+        response = await invoke_llm(messages, state, config)
+        analysis = await validate_reply(response, messages, PriorityAnalysis)
         
         # Match og oppdater brukere
+        priority_by_email = {p["email"]: p for p in analysis["users"]}
         prioritized = []
         for user in users_with_roles:
-            if user["email"] in {p.email for p in analysis.users}:
-                priority_user = next(p for p in analysis.users if p.email == user["email"])
-                prioritized.append({
-                    **user,
-                    "priority_score": priority_user.score,
-                    "priority_reason": priority_user.reason,
-                    "sources": user["sources"] + ["prioritized"]
-                })
+            priority_user = priority_by_email.get(user["email"])
+            if priority_user is None:
+                continue
+            prioritized.append(user | {
+                "priority_score": priority_user["score"],
+                "priority_reason": priority_user["reason"],
+                "sources": (*user["sources"], "prioritized")
+            })
         
         return {
-            "messages": state["messages"] + [
+            "messages": [
                 AIMessage(content=f"Prioriterte {len(prioritized)} brukere")
             ],
-            "users": prioritized,
-            "config": state["config"]
+            "users": prioritized
         }
     except Exception as e:
-        logging.error(f"Feil i prioritering: {str(e)}")
+        logging.error("Feil i prioritering: %s", e)
         return {
-            "messages": state["messages"] + [HumanMessage(content=f"Feil i prioritering: {str(e)}")],
-            "users": state["users"],
-            "config": state["config"]
+            "messages": [HumanMessage(content=f"Feil i prioritering: {str(e)}")]
         }
 
-# LINKEDIN DATA NODE
-@traceable(run_type="chain", name="get_linkedin_data")
-def get_linkedin_data(state: AgentState, config: RunnableConfig) -> AgentState:
-    """Henter LinkedIn data for prioriterte brukere."""
-    prioritized_users = [u for u in state["users"] 
-                        if "prioritized" in u.get("sources", [])
-                        and u.get("linkedin_url")]
-    
-    if not prioritized_users:
-        return {
-            "messages": state["messages"] + [HumanMessage(content="Ingen brukere å berike")],
-            "users": state["users"],
-            "config": state["config"]
-        }
-    
-    enriched = []
-    messages = []
+# LINKEDIN OG ANALYSE
+async def fetch_linkedin(user: Dict, state: AgentState) -> Dict:
+    """Henter LinkedIn data for én bruker og legger den til i bruker-objektet."""
+    linkedin_data = await get_linkedin_profile(
+        user["linkedin_url"],
+        bypass_cache=state["config"].get("bypass_cache", False)
+    )
+    return user | {
+        "linkedin_raw": linkedin_data,
+        "sources": (*user["sources"], "linkedin")
+    }
+
+async def analyze_batch(users: List[Dict], state: AgentState, config: RunnableConfig, sem: asyncio.Semaphore) -> Dict[str, Dict]:
+    """Analyserer flere profiler i ett LLM-kall, nøklet på email."""
+    raw_profiles = [
+        {"email": u["email"], "profile_data": prune_profile(u)}
+        for u in users
+    ]
+    prompt = BATCH_ANALYSIS_TEMPLATE.format_messages(
+        raw_profiles=to_prompt_json(raw_profiles),
+        target_role=state["config"]["target_role"]
+    )
+    async with sem:
+        response = await invoke_llm(prompt, state, config)
+    return (await validate_reply(response, prompt, BatchProfileAnalysis))["users"]
+
+async def analyze_user(user: Dict, state: AgentState, config: RunnableConfig, sem: asyncio.Semaphore) -> Dict:
+    """Fallback: analyserer én profil alene."""
+    profile_data = prune_profile(user)
     
-    for user in prioritized_users:
+    prompt = ANALYSIS_TEMPLATE.format_messages(
+        raw_profile=to_prompt_json(profile_data),
+        target_role=state["config"]["target_role"]
+    )
+    async with sem:
+        response = await invoke_llm(prompt, state, config)
+    return await validate_reply(response, prompt, User)
+
+async def analyze_chunk(
+    users: List[Dict],
+    state: AgentState,
+    config: RunnableConfig,
+    sem: asyncio.Semaphore
+) -> Tuple[List[Dict], List[BaseMessage]]:
+    """Analyserer en gruppe profiler i ett kall, og enkeltvis de som mangler i svaret."""
+    with batch_timestamp():
         try:
-            linkedin_data = linkedin_tool.invoke({"linkedin_url": user["linkedin_url"]})
-            enriched_user = {
-                **user,
-                "linkedin_raw": linkedin_data["data"],
-                "sources": user["sources"] + ["linkedin"]
-            }
-            enriched.append(enriched_user)
-            messages.append(
-                ToolMessage(
-                    tool_call_id=f"linkedin_{user['email']}",
-                    tool_name="linkedin",
-                    content=f"Hentet LinkedIn data for {user['email']}"
-                )
-            )
+            analyses = await analyze_batch(users, state, config, sem)
         except Exception as e:
-            messages.append(
-                ToolMessage(
-                    tool_call_id=f"linkedin_error_{user['email']}",
-                    tool_name="linkedin",
-                    content=f"Feil: {str(e)}"
-                )
-            )
-    
-    return {
-        "messages": state["messages"] + messages,
-        "users": enriched or state["users"],
-        "config": state["config"]
-    }
+            logging.error("Feil i batch-analyse: %s", e)
+            analyses = {}
 
-# ANALYSE NODE
-@traceable(run_type="chain", name="analyze_profiles")
-def analyze_profiles(state: AgentState, config: RunnableConfig) -> AgentState:
-    """Analyserer LinkedIn profiler."""
-    users_to_analyze = [u for u in state["users"] 
-                       if "linkedin" in u.get("sources", [])]
-    
-    if not users_to_analyze:
-        return {
-            "messages": state["messages"] + [HumanMessage(content="Ingen profiler å analysere")],
-            "users": state["users"],
-            "config": state["config"]
-        }
+        missing = [u for u in users if u["email"] not in analyses]
+        if missing:
+            results = await asyncio.gather(
+                *(analyze_user(u, state, config, sem) for u in missing),
+                return_exceptions=True
+            )
+            analyses.update({u["email"]: r for u, r in zip(missing, results)})
     
     analyzed = []
     messages = []
     
-    for user in users_to_analyze:
-        try:
-            profile_data = {**user, **user["linkedin_raw"]}
-            
-            # Kjør én samlet analyse
-            messages = [
-                SystemMessage(content=ANALYSIS_SYSTEM_PROMPT),
-                HumanMessage(content=ANALYSIS_PROMPT.format(
-                    raw_profile=json.dumps(profile_data, indent=2),
-                    target_role=state["config"]["target_role"],
-                    model_schema=get_model_schema(User)
-                ))
-            ]
-            response = llm.invoke(messages)
-            if isinstance(response, AIMessage):
-                analysis_results = validate_llm_output(response.content, User)
-            else:
-                raise ValueError(f"Uventet respons type: {type(response)}")
-            
-            analyzed_user = {
-                **user,
-                **analysis_results,  # Flater ut analysen direkte i bruker-objektet
-                "sources": user["sources"] + ["analyzed"]
-            }
-            analyzed.append(analyzed_user)
-            messages.extend([
-                ToolMessage(
-                    tool_call_id=f"analyze_{user['email']}",
-                    tool_name="analyze",
-                    content=f"Analyserte profil for {user['email']}"
-                ),
-                AIMessage(content=f"Analyse fullført for {user['email']}")
-            ])
-        except Exception as e:
+    for user in users:
+        result = analyses[user["email"]]
+        if isinstance(result, Exception):
             messages.extend([
                 ToolMessage(
                     tool_call_id=f"analyze_error_{user['email']}",
                     tool_name="analyze",
-                    content=f"Feil: {str(e)}"
+                    content=f"Feil: {str(result)}"
                 ),
                 AIMessage(content=f"Analyse feilet for {user['email']}")
             ])
-    
-    return {
-        "messages": state["messages"] + messages,
-        "users": analyzed or state["users"],
-        "config": state["config"]
-    }
+            continue
+        # Flater ut analysen direkte i bruker-objektet
+        analyzed.append(user | result | {"sources": (*user["sources"], "analyzed")})
+        messages.extend([
+            ToolMessage(
+                tool_call_id=f"analyze_{user['email']}",
+                tool_name="analyze",
+                content=f"Analyserte profil for {user['email']}"
+            ),
+            AIMessage(content=f"Analyse fullført for {user['email']}")
+        ])
+    return analyzed, messages
+
+# BERIKELSE NODE
+@traceable(run_type="chain", name="enrich_profiles")
+async def enrich_profiles(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+    """Henter LinkedIn data og analyserer profilene i én pipeline.
+
+    Analysen av en gruppe på ANALYSIS_BATCH_SIZE profiler starter så snart
+    gruppen er hentet, mens resten av profilene fortsatt hentes.
+    """
+    prioritized_users = [u for u in state["users"] 
+                        if "prioritized" in u.get("sources", ())
+                        and u.get("linkedin_url")]
+
+    # Berik kun de max_results høyest prioriterte, i score-rekkefølge
+    prioritized_users.sort(key=lambda u: u.get("priority_score", 0), reverse=True)
+    prioritized_users = prioritized_users[:state["config"].get("max_results", 5)]
+
+    # I batch-modus sendes analysen til OpenAI Batch API av batch.py
+    batch_mode = state["config"].get("batch_mode", False)
+    llm_sem = asyncio.Semaphore(LLM_CONCURRENCY)
+
+    async def fetch(user: Dict) -> Tuple[Dict, Union[Dict, Exception]]:
+        try:
+            return user, await fetch_linkedin(user, state)
+        except Exception as e:
+            return user, e
+
+    enriched = []
+    messages = []
+    pending = []
+    analysis_tasks = []
+    fetch_tasks = [asyncio.create_task(fetch(u)) for u in prioritized_users]
+
+    # Avbrytes noden (f.eks. når en SSE-klient kobler fra), stoppes hentinger og
+    # analyser som fortsatt kjører, så de ikke bruker LLM-tokens for ingenting
+    try:
+
+        for next_fetch in asyncio.as_completed(fetch_tasks):
+            user, result = await next_fetch
+            if isinstance(result, Exception):
+                messages.append(
+                    ToolMessage(
+                        tool_call_id=f"linkedin_error_{user['email']}",
+                        tool_name="linkedin",
+                        content=f"Feil: {str(result)}"
+                    )
+                )
+                continue
+            enriched.append(result)
+            messages.append(
+                ToolMessage(
+                    tool_call_id=f"linkedin_{user['email']}",
+                    tool_name="linkedin",
+                    content=f"Hentet LinkedIn data for {user['email']}"
+                )
+            )
+            if batch_mode:
+                continue
+            pending.append(result)
+            if len(pending) == ANALYSIS_BATCH_SIZE:
+                analysis_tasks.append(asyncio.create_task(analyze_chunk(pending, state, config, llm_sem)))
+                pending = []
+
+        if not enriched:
+            messages.append(HumanMessage(content="Ingen profiler å analysere"))
+            return {"messages": messages}
+
+        if batch_mode:
+            messages.append(AIMessage(content=f"Analyse av {len(enriched)} profiler utsatt til batch"))
+            return {"messages": messages, "users": enriched}
+
+        if pending:
+            analysis_tasks.append(asyncio.create_task(analyze_chunk(pending, state, config, llm_sem)))
+
+        analyzed = []
+        for chunk_analyzed, chunk_messages in await asyncio.gather(*analysis_tasks):
+            analyzed.extend(chunk_analyzed)
+            messages.extend(chunk_messages)
+
+        # Uten vellykkede analyser beholdes de berikede profilene
+        return {"messages": messages, "users": analyzed or enriched}
+    finally:
+        for task in fetch_tasks + analysis_tasks:
+            if not task.done():
+                task.cancel()
 
 # Oppdater workflow
 def create_workflow() -> StateGraph:
@@ -304,27 +594,30 @@ def create_workflow() -> StateGraph:
     # Legg til noder
     workflow.add_node("collect", collect_hunter_data)
     workflow.add_node("prioritize", prioritize_users)
-    workflow.add_node("get_linkedin_data", get_linkedin_data)
-    workflow.add_node("analyze", analyze_profiles)
+    workflow.add_node("enrich", enrich_profiles)
     workflow.add_node("tools", ToolNode([linkedin_tool, hunter_tool]))
     
     # Sett entry point
     workflow.set_entry_point("collect")
     
     # Definer flyt
-    workflow.add_edge("collect", "prioritize")
-    workflow.add_edge("prioritize", "get_linkedin_data")
-    workflow.add_edge("get_linkedin_data", "analyze")
-    workflow.add_edge("analyze", "tools")
-    workflow.add_edge("tools", "analyze")
+    workflow.add_edge("tools", "enrich")
     
     # Betinget routing
     workflow.add_conditional_edges(
         "collect",
         lambda s: "prioritize" if s["users"] else "__end__"
     )
+    # Hopp over LinkedIn og analyse når ingen prioritert bruker har en LinkedIn-URL
+    workflow.add_conditional_edges(
+        "prioritize",
+        lambda s: "enrich" if any(
+            u.get("priority_score", 0) > 0 and u.get("linkedin_url")
+            for u in s["users"]
+        ) else "__end__"
+    )
     workflow.add_conditional_edges(
-        "analyze",
+        "enrich",
         tools_condition,
         {
             "tools": "tools",
@@ -344,20 +637,83 @@ def get_config() -> RunnableConfig:
 # Compile workflow
 app = create_workflow()
 
-def analyze_domain(
+def initial_state(
     domain: str,
     target_role: str,
-    max_results: int = 5
-) -> Dict[str, Any]:
-    """Kjør full analyse av et domene."""
-    return app.invoke({
+    max_results: int = 5,
+    bypass_cache: bool = False,
+    batch_mode: bool = False
+) -> AgentState:
+    """Bygger start-state for et søk."""
+    return {
         "messages": [],
         "users": [],
         "config": SearchConfig(
             domain=domain,
             target_role=target_role,
-            max_results=max_results
+            max_results=max_results,
+            bypass_cache=bypass_cache,
+            batch_mode=batch_mode
         )
-    })
+    }
+
+def analyze_domain(
+    domain: str,
+    target_role: str,
+    max_results: int = 5,
+    bypass_cache: bool = False
+) -> Dict[str, Any]:
+    """Kjør full analyse av et domene."""
+    async def run() -> Dict[str, Any]:
+        # Loopen lever kun for dette kallet, så klientene lukkes før den avsluttes
+        try:
+            return await app.ainvoke(initial_state(domain, target_role, max_results, bypass_cache))
+        finally:
+            await close_openai_clients()
+            await close_http_client()
+
+    return asyncio.run(run())
+
+async def analyze_domains(
+    domains: List[str],
+    target_role: str,
+    max_results: int = 5,
+    max_parallel: int = 8,
+    batch_mode: bool = False
+) -> List[Dict[str, Any]]:
+    """Kjør full analyse av flere domener samtidig.
+
+    Maks max_parallel domener kjøres om gangen, og alle deler de samme
+    HTTP-klientene. Resultatene returneres i samme rekkefølge som domains.
+    """
+    sem = asyncio.Semaphore(max_parallel)
+
+    async def analyze_one(domain: str) -> Dict[str, Any]:
+        async with sem:
+            return await app.ainvoke(
+                initial_state(domain, target_role, max_results, batch_mode=batch_mode),
+                config=get_config()
+            )
+
+    return await asyncio.gather(*(analyze_one(d) for d in domains))
+
+async def stream_domain(
+    domain: str,
+    target_role: str,
+    max_results: int = 5,
+    bypass_cache: bool = False
+) -> AsyncIterator[Dict[str, Any]]:
+    """Strømmer endringene fra hver node etter hvert som de er ferdige.
+
+    Prioriterte brukere (med priority_score) kommer dermed ut før
+    LinkedIn-berikelse og analyse (enrich) er ferdig.
+    """
+    async for update in app.astream(
+        initial_state(domain, target_role, max_results, bypass_cache),
+        config=get_config(),
+        stream_mode="updates"
+    ):
+        for node, delta in update.items():
+            yield {"node": node, **(delta or {})}
 
-__all__ = ['app', 'get_config', 'analyze_domain']
\ No newline at end of file
+__all__ = ['app', 'get_config', 'initial_state', 'analyze_domain', 'analyze_domains', 'stream_domain']
\ No newline at end of file
@@ -1,17 +1,26 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any
-from agent import app as workflow_app, get_config
-from models import SearchConfig, User
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, SerializeAsAny, TypeAdapter
+from typing import AsyncIterator, List, Any
+from langchain_core.messages import BaseMessage
+import orjson
+from agent import app as workflow_app, get_config, stream_domain, close_openai_clients
+from tools import close_http_client
+from models import SearchConfig
 
 class SearchRequest(BaseModel):
     domain: str
     target_role: str
     max_results: int = 5
+    bypass_cache: bool = False
+
+# SerializeAsAny beholder feltene til subklassene (tool_call_id osv.)
+MESSAGES_ADAPTER = TypeAdapter(List[SerializeAsAny[BaseMessage]])
 
 class SearchResponse(BaseModel):
-    messages: List[Dict[str, Any]]
-    users: List[Dict[str, Any]]
+    # Utypede lister: innholdet er allerede validert i agenten, så pydantic sjekker kun listen
+    messages: list
+    users: list
 
 app = FastAPI(
     title="Prospect Agent API",
@@ -19,26 +28,59 @@ app = FastAPI(
     version="1.0.0"
 )
 
+@app.on_event("shutdown")
+async def shutdown():
+    await close_openai_clients()
+    await close_http_client()
+
 @app.post("/search", response_model=SearchResponse)
 async def search_prospects(request: SearchRequest):
     try:
-        result = workflow_app.invoke({
+        result = await workflow_app.ainvoke({
             "messages": [],
             "users": [],
             "config": SearchConfig(
                 domain=request.domain,
                 target_role=request.target_role,
-                max_results=request.max_results
+                max_results=request.max_results,
+                bypass_cache=request.bypass_cache
             )
         }, config=get_config())
         
         return {
-            "messages": [msg.dict() for msg in result["messages"]],
+            "messages": MESSAGES_ADAPTER.dump_python(result["messages"], mode="json"),
             "users": result["users"]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _to_json(obj: Any) -> Any:
+    """Gjør meldinger serialiserbare for orjson"""
+    if isinstance(obj, BaseMessage):
+        return obj.model_dump()
+    raise TypeError(f"Kan ikke serialisere {type(obj)}")
+
+def _sse_event(event: str, data: Any) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data, default=_to_json) + b"\n\n"
+
+@app.post("/search/stream")
+async def stream_prospects(request: SearchRequest):
+    """Strømmer endringene fra hver node som Server-Sent Events"""
+    async def events() -> AsyncIterator[bytes]:
+        try:
+            async for update in stream_domain(
+                request.domain,
+                request.target_role,
+                request.max_results,
+                request.bypass_cache
+            ):
+                yield _sse_event(update["node"], update)
+        except Exception as e:
+            yield _sse_event("error", {"detail": str(e)})
+        yield _sse_event("end", {})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 @app.get("/")
 async def root():
     return {"message": "Velkommen til Prospect Agent API"} 
\ No newline at end of file
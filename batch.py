@@ -0,0 +1,164 @@
+from typing import List, Dict, Any, Optional
+from langchain_core.messages import convert_to_openai_messages
+import orjson
+import logging
+import os
+from agent import (
+    analyze_domains,
+    get_openai_clients,
+    prune_profile,
+    to_prompt_json,
+    MODEL_NAME,
+    TEMPERATURE,
+    ANALYSIS_TEMPLATE,
+    JSON_RESPONSE_FORMAT,
+)
+from prompts import validate_llm_output
+from models import User, batch_timestamp
+
+# Batch API gir 50% lavere pris mot 24 timers leveringstid
+BATCH_STATE_PATH = os.getenv("BATCH_STATE_PATH", ".batch_state.json")
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+
+# Statuser der batchen aldri blir ferdig, polling må stoppe
+BATCH_FAILED_STATUSES = frozenset({"failed", "expired", "cancelled"})
+
+class BatchError(Exception):
+    """Batchen feilet, utløp eller ble avbrutt, og gir ingen resultater"""
+    pass
+
+def _custom_id(domain: str, email: str) -> str:
+    """Unik id per forespørsel, brukes til å koble svar tilbake til brukeren"""
+    return f"{domain}|{email}|profile"
+
+def _build_request(custom_id: str, user: Dict, target_role: str) -> Dict[str, Any]:
+    """Bygger én chat-completion forespørsel i Batch API-format"""
+    messages = ANALYSIS_TEMPLATE.format_messages(
+        raw_profile=to_prompt_json(prune_profile(user)),
+        target_role=target_role
+    )
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": MODEL_NAME,
+            "temperature": TEMPERATURE,
+            "response_format": JSON_RESPONSE_FORMAT,
+            "messages": convert_to_openai_messages(messages)
+        }
+    }
+
+def _batch_errors(batch: Any) -> str:
+    """Feilene OpenAI oppgir for batchen, som én linje"""
+    errors = batch.errors.data if batch.errors and batch.errors.data else []
+    return "; ".join(f"{e.code}: {e.message}" for e in errors) or "ingen detaljer"
+
+def _first_request_error(error_text: str) -> str:
+    """Første feil fra error-filen, for feilmeldingen når ingen forespørsler lyktes"""
+    for line in error_text.splitlines():
+        record = orjson.loads(line)
+        error = record.get("error") or record.get("response", {}).get("body", {}).get("error") or {}
+        return f"{record.get('custom_id')}: {error.get('message', 'ukjent feil')}"
+    return "ingen detaljer"
+
+def _save_state(state: Dict[str, Any]) -> None:
+    with open(BATCH_STATE_PATH, "wb") as f:
+        f.write(orjson.dumps(state))
+
+def _load_state() -> Dict[str, Any]:
+    with open(BATCH_STATE_PATH, "rb") as f:
+        return orjson.loads(f.read())
+
+async def submit_batch(
+    domains: List[str],
+    target_role: str,
+    max_results: int = 5
+) -> str:
+    """Samler og beriker kontakter for alle domener, og sender analysen til Batch API.
+
+    Hunter, prioritering og LinkedIn kjøres som vanlig. Kun profilanalysen
+    utsettes. batch_id og brukerne lagres i BATCH_STATE_PATH slik at
+    resultatene kan hentes med collect_batch, også etter omstart.
+    """
+    # custom_id bygges av domene og email, og OpenAI avviser filer med like id-er
+    if len(set(domains)) != len(domains):
+        raise ValueError("Samme domene er oppgitt flere ganger")
+
+    results = await analyze_domains(domains, target_role, max_results, batch_mode=True)
+
+    requests = []
+    users = {}
+    for domain, result in zip(domains, results):
+        for user in result["users"]:
+            if "linkedin" not in user.get("sources", ()):
+                continue
+            custom_id = _custom_id(domain, user["email"])
+            requests.append(_build_request(custom_id, user, target_role))
+            users[custom_id] = user
+
+    if not requests:
+        raise ValueError("Ingen profiler å analysere")
+
+    jsonl = b"\n".join(orjson.dumps(r) for r in requests)
+    openai_client = get_openai_clients().openai
+    batch_file = await openai_client.files.create(
+        file=("prospect_batch.jsonl", jsonl),
+        purpose="batch"
+    )
+    batch = await openai_client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW
+    )
+
+    _save_state({"batch_id": batch.id, "target_role": target_role, "users": users})
+    return batch.id
+
+async def collect_batch() -> Optional[Dict[str, List[Dict]]]:
+    """Henter resultatene for batchen i BATCH_STATE_PATH.
+
+    Returnerer None hvis batchen ikke er ferdig, ellers analyserte brukere
+    gruppert per domene. Brukere uten gyldig analyse returneres uendret.
+    Kaster BatchError hvis batchen aldri blir ferdig eller ingen forespørsler lyktes.
+    """
+    state = _load_state()
+    openai_client = get_openai_clients().openai
+    batch = await openai_client.batches.retrieve(state["batch_id"])
+    if batch.status in BATCH_FAILED_STATUSES:
+        raise BatchError(f"Batch {batch.id} har status {batch.status}: {_batch_errors(batch)}")
+    if batch.status != "completed":
+        logging.info("Batch %s har status %s", batch.id, batch.status)
+        return None
+
+    # Uten output-fil feilet alle forespørslene, og feilene ligger i error-filen
+    if batch.output_file_id is None:
+        detail = "ingen error-fil"
+        if batch.error_file_id is not None:
+            errors = await openai_client.files.content(batch.error_file_id)
+            detail = _first_request_error(errors.text)
+        raise BatchError(f"Ingen forespørsler i batch {batch.id} lyktes. Første feil: {detail}")
+
+    analyses = {}
+    output = await openai_client.files.content(batch.output_file_id)
+    with batch_timestamp():
+        for line in output.text.splitlines():
+            record = orjson.loads(line)
+            try:
+                body = record["response"]["body"]
+                content = body["choices"][0]["message"]["content"]
+                analyses[record["custom_id"]] = validate_llm_output(content, User)
+            except Exception as e:
+                logging.error("Feil i batch-svar for %s: %s", record.get("custom_id"), e)
+
+    results: Dict[str, List[Dict]] = {}
+    for custom_id, user in state["users"].items():
+        domain = custom_id.split("|", 1)[0]
+        analysis = analyses.get(custom_id)
+        if analysis is not None:
+            user = user | analysis | {"sources": (*user["sources"], "analyzed")}
+        results.setdefault(domain, []).append(user)
+    return results
+
+__all__ = ['submit_batch', 'collect_batch', 'BatchError']
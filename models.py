@@ -1,9 +1,37 @@
-from typing import List, Dict, Optional, Any
-from typing_extensions import TypedDict
-from pydantic import BaseModel, Field, validator
-from langchain_core.messages import BaseMessage
+from typing import List, Dict, Literal, Optional
+from typing_extensions import TypedDict, NotRequired
+from pydantic import BaseModel, Field, field_validator
+from pydantic.json_schema import SkipJsonSchema
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
 
+# Gyldige verdier for kategorifeltene i analysen. Valideres av pydantic-core
+# og listes som enum i JSON-schemaet som LLM-en får
+SeniorityLevel = Literal['Junior', 'Mid-level', 'Senior', 'Lead', 'Executive']
+ProficiencyLevel = Literal['Morsmål', 'Flytende', 'Profesjonelt', 'Begrenset']
+EngagementLevel = Literal['Høy', 'Moderat', 'Lav', 'Inaktiv']
+ConfidenceScore = Literal['Høy', 'Medium', 'Lav']
+
+# Øvre grense for avslutningsår, beregnet ved oppstart
+CURRENT_YEAR = datetime.now().year
+
+# Felles tidsstempel for brukere som valideres i samme batch
+_batch_now: ContextVar[Optional[datetime]] = ContextVar("batch_now", default=None)
+
+def batch_now() -> datetime:
+    """Tidsstempelet til gjeldende batch, eller nå hvis ingen batch er aktiv"""
+    return _batch_now.get() or datetime.now()
+
+@contextmanager
+def batch_timestamp():
+    """Gir alle brukere som bygges i blokken samme last_updated"""
+    token = _batch_now.set(datetime.now())
+    try:
+        yield
+    finally:
+        _batch_now.reset(token)
+
 #######################
 # API og Input/Output modeller
 #######################
@@ -11,6 +39,7 @@ from datetime import datetime
 class LinkedInInput(BaseModel):
     """Input for LinkedIn API"""
     linkedin_url: str = Field(..., description="LinkedIn profil URL")
+    bypass_cache: bool = Field(default=False, description="Hent ferske data uten cache")
 
 class HunterInput(BaseModel):
     """Input for Hunter API"""
@@ -18,6 +47,7 @@ class HunterInput(BaseModel):
     api_key: str = Field(..., description="Hunter.io API nøkkel")
     offset: int = Field(default=0, description="Offset for paginering")
     limit: int = Field(default=50, description="Antall resultater per side")
+    bypass_cache: bool = Field(default=False, description="Hent ferske data uten cache")
 
 class HunterResponse(BaseModel):
     """Strukturert respons fra Hunter API"""
@@ -36,24 +66,20 @@ class LinkedInRawData(BaseModel):
     country: Optional[str] = None
     current_company: Optional[str] = None
     current_job_title: Optional[str] = None
-    education: Optional[List[Dict]] = None
-    experiences: Optional[List[Dict]] = None
+    education: Optional[list] = None
+    experiences: Optional[list] = None
     full_name: Optional[str] = None
     headline: Optional[str] = None
     profile_pic_url: Optional[str] = None
-    languages: Optional[List[Dict]] = None
+    languages: Optional[list] = None
 
 class SearchConfig(TypedDict):
     """Konfigurasjon for søk"""
     domain: str
     target_role: str
     max_results: int
-
-class AgentState(TypedDict):
-    """State for agent workflow"""
-    messages: List[BaseMessage]
-    config: SearchConfig
-    users: List[Dict[str, Any]]
+    bypass_cache: NotRequired[bool]
+    batch_mode: NotRequired[bool]
 
 #######################
 # Basis datamodeller
@@ -156,7 +182,7 @@ class CareerInfo(BaseModel):
         description="Total relevant arbeidserfaring i år, inkluderer bare "
         "profesjonell erfaring etter fullført utdanning"
     )
-    seniority_level: str = Field(
+    seniority_level: SeniorityLevel = Field(
         ...,
         description="Vurdering av erfaringsnivå basert på roller, ansvar og "
         "innflytelse. Vurder både formell posisjon og reell påvirkningskraft"
@@ -168,13 +194,6 @@ class CareerInfo(BaseModel):
         "med fokus på målbare resultater og strategisk betydning"
     )
 
-    @validator('seniority_level')
-    def validate_seniority(cls, v):
-        valid_levels = ['Junior', 'Mid-level', 'Senior', 'Lead', 'Executive']
-        if v not in valid_levels:
-            raise ValueError(f'Ugyldig erfaringsnivå. Må være en av: {valid_levels}')
-        return v
-
 #######################
 # Analyse modeller - Kompetanse
 #######################
@@ -187,14 +206,7 @@ class ExpertiseInfo(BaseModel):
     class Language(BaseModel):
         """Språkferdighet med nivå"""
         name: str = Field(..., description="Språkets navn")
-        proficiency: str = Field(..., description="Ferdighetsnivå")
-
-        @validator('proficiency')
-        def validate_proficiency(cls, v):
-            valid_levels = ['Morsmål', 'Flytende', 'Profesjonelt', 'Begrenset']
-            if v not in valid_levels:
-                raise ValueError(f'Ugyldig språknivå. Må være en av: {valid_levels}')
-            return v
+        proficiency: ProficiencyLevel = Field(..., description="Ferdighetsnivå")
 
     primary_skills: List[str] = Field(
         ...,
@@ -243,13 +255,7 @@ class EducationInfo(BaseModel):
         name: str = Field(..., description="Navn på institusjon")
         degree: str = Field(..., description="Gradsbetegnelse")
         field: str = Field(..., description="Fagområde/studieretning")
-        year: int = Field(..., description="Avslutningsår")
-
-        @validator('year')
-        def validate_year(cls, v):
-            if v < 1950 or v > datetime.now().year:
-                raise ValueError(f'Ugyldig år: {v}')
-            return v
+        year: int = Field(..., ge=1950, le=CURRENT_YEAR, description="Avslutningsår")
 
     highest_degree: str = Field(...)
     field_of_study: str = Field(...)
@@ -279,7 +285,7 @@ class NetworkInfo(BaseModel):
         description="Antall følgere på LinkedIn, indikerer rekkevidde og "
         "innflytelse i profesjonelle nettverk"
     )
-    engagement_level: str = Field(
+    engagement_level: EngagementLevel = Field(
         ...,
         description="Kvalitativ vurdering av aktivitetsnivå og engasjement i "
         "nettverket. Vurder hyppighet og kvalitet på interaksjoner"
@@ -307,13 +313,6 @@ class NetworkInfo(BaseModel):
         "profesjonelle relasjoner. Beskriv typiske mønstre i nettverksbygging"
     )
 
-    @validator('engagement_level')
-    def validate_engagement(cls, v):
-        valid_levels = ['Høy', 'Moderat', 'Lav', 'Inaktiv']
-        if v not in valid_levels:
-            raise ValueError(f'Ugyldig engasjementsnivå. Må være en av: {valid_levels}')
-        return v
-
 #######################
 # Analyse modeller - Personlighet
 #######################
@@ -512,7 +511,7 @@ class MetaInfo(BaseModel):
         description="Liste over alle datakilder brukt i analysen, f.eks. "
         "['LinkedIn profil', 'Prosjektbeskrivelser', 'Artikler og innlegg']"
     )
-    confidence_score: Optional[str] = Field(
+    confidence_score: Optional[ConfidenceScore] = Field(
         None,
         description="Samlet vurdering av datakvalitet og analysesikkerhet. "
         "Vurder mengde, konsistens og kvalitet på tilgjengelig data"
@@ -548,31 +547,26 @@ class MetaInfo(BaseModel):
         le=1
     )
 
-    @validator('confidence_score')
-    def validate_confidence(cls, v):
-        if v is not None:
-            valid_scores = ['Høy', 'Medium', 'Lav']
-            if v not in valid_scores:
-                raise ValueError(f'Ugyldig confidence score. Må være en av: {valid_scores}')
-        return v
-
 class PriorityUser(BaseModel):
     """Prioritert bruker med score og begrunnelse"""
     email: str = Field(..., description="Brukerens email")
     score: float = Field(..., description="Prioriteringsscore (0-1)", ge=0, le=1)
     reason: str = Field(..., description="Begrunnelse for score")
 
-    @validator('email')
+    @field_validator('email')
+    @classmethod
     def validate_email(cls, v):
         if '@' not in v:
             raise ValueError('Ugyldig email format')
-        return v.lower()  # Standardiser til lowercase
+        # Standardiser til lowercase, uten ny streng når den allerede er det
+        return v if v.islower() else v.lower()
 
 class PriorityAnalysis(BaseModel):
     """Resultat av prioriteringsanalyse"""
     users: List[PriorityUser] = Field(..., description="Liste over prioriterte brukere")
     
-    @validator('users')
+    @field_validator('users')
+    @classmethod
     def validate_users(cls, v):
         if not v:
             raise ValueError('Prioriteringsanalyse må inneholde minst én bruker')
@@ -600,7 +594,16 @@ class User(BaseModel):
     personality: Optional[PersonalityInfo] = None
     meta: Optional[MetaInfo] = None
     
-    # Tracking
-    sources: List[str] = Field(default_factory=list)
-    last_updated: datetime = Field(default_factory=datetime.now)
+    # Tracking, fylles av agenten og holdes utenfor schemaet LLM-en får
+    sources: SkipJsonSchema[List[str]] = Field(default_factory=list)
+    last_updated: SkipJsonSchema[datetime] = Field(default_factory=batch_now)
+
+class BatchProfileAnalysis(BaseModel):
+    """Samlet analyse av flere profiler i ett LLM-kall"""
+    users: Dict[str, User] = Field(
+        ...,
+        description="Analyse per bruker, nøklet på brukerens email"
+    )
 
+# Modellene hvis JSON-schema sendes med i prompts, og bakes inn av scripts/bake_schemas.py
+PROMPT_MODELS = (PriorityAnalysis, User, BatchProfileAnalysis)
\ No newline at end of file
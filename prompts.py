@@ -1,23 +1,36 @@
 from typing import Type, Dict, Any
-import json
-from pydantic import BaseModel
-from models import (
-    User, BasicInfo, CareerInfo, ExpertiseInfo, 
-    EducationInfo, NetworkInfo, PersonalityInfo, MetaInfo
-)
+import orjson
+from functools import cache
+from pathlib import Path
+import os
+from pydantic import BaseModel, ValidationError
 
-def get_model_schema(model_class: Type[BaseModel]) -> str:
-    """Henter JSON schema for en modell i lesbart format"""
+# Ferdig genererte schemaer, skrevet av scripts/bake_schemas.py ved bygg.
+# Brukes kun når bygget slår det på, ellers kan et lokalt bakt schema være utdatert
+SCHEMA_DIR = Path(__file__).parent / "_schemas"
+USE_BAKED_SCHEMAS = os.getenv("USE_BAKED_SCHEMAS") == "1"
+
+def render_model_schema(model_class: Type[BaseModel]) -> str:
+    """Genererer kompakt JSON schema for en modell, uten innrykk som koster tokens"""
     schema = model_class.model_json_schema()
-    return json.dumps(schema, indent=2, ensure_ascii=False)
+    return orjson.dumps(schema).decode()
 
+@cache
+def get_model_schema(model_class: Type[BaseModel]) -> str:
+    """Henter JSON schema for en modell, fra _schemas/ hvis bygget har bakt det inn"""
+    baked = SCHEMA_DIR / f"{model_class.__name__}.json"
+    if USE_BAKED_SCHEMAS and baked.exists():
+        return baked.read_text(encoding="utf-8")
+    return render_model_schema(model_class)
+
+@cache
 def get_nested_field_descriptions(model_class: Type[BaseModel]) -> str:
     """Henter feltbeskrivelser for en modell med sub-modeller"""
     descriptions = []
     for field_name, field_info in model_class.model_fields.items():
-        if hasattr(field_info.annotation, 'model_fields'):
+        sub_model = field_info.annotation
+        if isinstance(sub_model, type) and issubclass(sub_model, BaseModel):
             descriptions.append(f"\n{field_name.upper()}:")
-            sub_model = field_info.annotation
             for sub_field, sub_info in sub_model.model_fields.items():
                 desc = sub_info.description or "Ingen beskrivelse tilgjengelig"
                 descriptions.append(f"- {sub_field}: {desc}")
@@ -28,13 +41,24 @@ def get_nested_field_descriptions(model_class: Type[BaseModel]) -> str:
 
 def validate_llm_output(output: str, model_class: Type[BaseModel]) -> Dict[str, Any]:
     """Validerer og konverterer LLM output mot modell"""
+    # Fjern markdown-blokk (```json ... ```) som enkelte svar pakkes inn i
+    output = output.strip()
+    if output.startswith("```"):
+        output = output.split("```", 2)[1].removeprefix("json")
+    # Parsing og validering i ett pass i pydantic-core, ugyldig JSON gir også ValidationError
     try:
-        data = json.loads(output)
-        validated = model_class(**data)
-        return validated.model_dump()
-    except Exception as e:
+        return model_class.model_validate_json(output).model_dump()
+    except ValidationError as e:
         raise ValueError(f"Ugyldig output format: {str(e)}")
 
+# Schema-delen legges i systemmeldingen. Da er starten av hver forespørsel lik
+# for alle kall med samme mal, og OpenAI kan cache prefikset
+OUTPUT_FORMAT_PROMPT = """
+OUTPUT FORMAT:
+VIKTIG: Returner kun et gyldig JSON-objekt som følger denne modellen:
+{model_schema}
+"""
+
 ANALYSIS_PROMPT = """
 Utfør en komplett analyse av denne profilen med fokus på B2B-salgspotensial.
 
@@ -43,11 +67,17 @@ PROFIL:
 
 MÅLROLLE/PRODUKT:
 {target_role}
+"""
 
-OUTPUT FORMAT:
-VIKTIG: Returner kun et gyldig JSON-objekt som følger denne modellen:
-{model_schema}
+BATCH_ANALYSIS_PROMPT = """
+Utfør en komplett analyse av hver av disse profilene med fokus på B2B-salgspotensial.
+Hver profil skal analyseres for seg, og resultatet nøkles på profilens email.
 
+PROFILER:
+{raw_profiles}
+
+MÅLROLLE/PRODUKT:
+{target_role}
 """
 
 PRIORITY_PROMPT = """
@@ -65,8 +95,5 @@ PRIORITERINGSKRITERIER:
 - Timing og tilgjengelighet
 - Datakvalitet og aktualitet
 
-VIKTIG: Returner kun et gyldig JSON-objekt som følger denne modellen:
-{model_schema}
-
 max_results: {max_results}
 """ 
\ No newline at end of file
@@ -0,0 +1,35 @@
+"""Skriver JSON-schemaene som sendes i prompts til _schemas/.
+
+Kjøres ved bygg av Docker-imaget, som også setter USE_BAKED_SCHEMAS=1. Uten den
+genereres schemaene fra modellene ved oppstart, så lokale filer kan ikke bli utdaterte:
+
+    python scripts/bake_schemas.py          # skriv schemaer
+    python scripts/bake_schemas.py --check  # feiler hvis noen er utdatert
+"""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from prompts import SCHEMA_DIR, render_model_schema
+from models import PROMPT_MODELS
+
+def main(check: bool = False) -> int:
+    SCHEMA_DIR.mkdir(exist_ok=True)
+    stale = []
+    for model_class in PROMPT_MODELS:
+        path = SCHEMA_DIR / f"{model_class.__name__}.json"
+        schema = render_model_schema(model_class)
+        if check:
+            if not path.exists() or path.read_text(encoding="utf-8") != schema:
+                stale.append(path)
+            continue
+        path.write_text(schema, encoding="utf-8")
+        print(f"Skrev {path}")
+
+    for path in stale:
+        print(f"Utdatert: {path}")
+    return 1 if stale else 0
+
+if __name__ == "__main__":
+    sys.exit(main(check="--check" in sys.argv))
@@ -1,15 +1,24 @@
-from typing import Dict, Optional, List
-from langchain_core.tools import StructuredTool, BaseTool
-from pydantic import BaseModel, Field
-import requests
+from typing import Dict
+from langchain_core.tools import StructuredTool
+from langsmith import traceable
+import asyncio
+import httpx
+import orjson
+import hashlib
+import random
+import time
+from types import MappingProxyType
 import os
+from cachetools import TTLCache
+from diskcache import Cache
+from dotenv import load_dotenv
 from models import (
-    LinkedInRawData, 
     LinkedInInput,
-    HunterInput,
-    HunterResponse
+    HunterInput
 )
 
+load_dotenv()
+
 class LinkedInAPIError(Exception):
     """Custom error for LinkedIn API issues"""
     pass
@@ -18,51 +27,198 @@ class HunterAPIError(Exception):
     """Custom error for Hunter API issues"""
     pass
 
-def get_linkedin_profile(linkedin_url: str) -> Dict:
-    """Henter LinkedIn profil data via RapidAPI."""
-    headers = {
-        'X-RapidAPI-Key': os.getenv('RAPIDAPI_KEY'),
-        'X-RapidAPI-Host': 'fresh-linkedin-profile-data.p.rapidapi.com'
-    }
-    
+# Cache for rå LinkedIn-data. Lagrer kun scraper-JSON, ikke Pydantic-objekter.
+LINKEDIN_CACHE_DIR = os.getenv("LINKEDIN_CACHE_DIR", "./cache/linkedin")
+LINKEDIN_CACHE_TTL = int(os.getenv("LINKEDIN_CACHE_TTL", 7 * 24 * 3600))
+LINKEDIN_SCRAPER_VERSION = "2"
+CACHE_DISABLED = os.getenv("CACHE_DISABLE") == "1"
+
+linkedin_cache = Cache(LINKEDIN_CACHE_DIR)
+
+# Minne-cache foran disk-cachen for LinkedIn, og eneste cache for Hunter-sider.
+# Alt kjører på event-loopen, så cachene trenger ingen lås
+MEMORY_CACHE_TTL = int(os.getenv("MEMORY_CACHE_TTL", 3600))
+linkedin_memory_cache = TTLCache(maxsize=2048, ttl=MEMORY_CACHE_TTL)
+hunter_memory_cache = TTLCache(maxsize=1024, ttl=MEMORY_CACHE_TTL)
+
+# Delt klient for Hunter og LinkedIn per event-loop, gjenbruker TLS-tilkoblinger mellom kall.
+# En httpx-klient er bundet til loopen den først brukes på, så hver loop får sin egen
+_http_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+def get_http_client() -> httpx.AsyncClient:
+    """Henter klienten for loopen som kjører, og lager den ved første kall"""
+    loop = asyncio.get_running_loop()
+    # Klienter for looper som er lukket uten close_http_client kan ikke brukes igjen
+    for stale in [l for l in _http_clients if l.is_closed()]:
+        del _http_clients[stale]
+    client = _http_clients.get(loop)
+    if client is None:
+        # Transporten prøver mislykkede tilkoblinger på nytt, 429/5xx håndteres i _get.
+        # Kort connect-timeout så et dødt endepunkt feiler raskt, lengre for selve svaret
+        client = _http_clients[loop] = httpx.AsyncClient(
+            timeout=httpx.Timeout(20.0, connect=3.05),
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=2,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+            )
+        )
+    return client
+
+# Nye forsøk ved rate limit (429) og serverfeil (5xx) skjer her, rett rundt HTTP-kallet,
+# så agenten ser kun feil som ikke går over av seg selv
+HTTP_RETRY_ATTEMPTS = 3
+HTTP_RETRY_MAX_WAIT = 8.0
+
+class RateLimiter:
+    """Slipper gjennom maks `rate` kall per sekund, jevnt fordelt"""
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+
+    async def acquire(self) -> None:
+        # Ingen await før plassen er reservert, så ingen lås trengs
+        now = time.monotonic()
+        wait = self.next_slot - now
+        self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+# LinkedIn-scraperen blokkerer ved for mange kall. Limiteren er felles for alle søk og
+# er eneste struping av LinkedIn-kallene, så backoff ved 429 holder ikke av plass for andre
+linkedin_limiter = RateLimiter(float(os.getenv("LINKEDIN_RATE_LIMIT", 5)))
+hunter_limiter = RateLimiter(float(os.getenv("HUNTER_RATE_LIMIT", 15)))
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Ventetid før neste forsøk: Retry-After hvis API-et oppgir det, ellers backoff med jitter"""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), HTTP_RETRY_MAX_WAIT)
+        except ValueError:
+            pass  # HTTP-dato, faller tilbake til backoff
+    return random.uniform(0, min(2 ** attempt, HTTP_RETRY_MAX_WAIT))
+
+async def _get(url: str, limiter: RateLimiter, **kwargs) -> httpx.Response:
+    """GET med rate limit og nye forsøk ved 429/5xx. Kaster HTTPStatusError når forsøkene er brukt opp."""
+    for attempt in range(1, HTTP_RETRY_ATTEMPTS + 1):
+        await limiter.acquire()
+        response = await get_http_client().get(url, **kwargs)
+        retryable = response.status_code == 429 or response.status_code >= 500
+        if not retryable or attempt == HTTP_RETRY_ATTEMPTS:
+            break
+        await asyncio.sleep(_retry_delay(response, attempt))
+    response.raise_for_status()
+    return response
+
+# Seksjoner vi ikke bruker slås av i scraperen, like for alle kall
+LINKEDIN_BASE_PARAMS = MappingProxyType({
+    "include_skills": "false",
+    "include_certifications": "false",
+    "include_publications": "false",
+    "include_honors": "false",
+    "include_volunteers": "false",
+    "include_projects": "false",
+    "include_patents": "false",
+    "include_courses": "false",
+    "include_organizations": "false",
+    "include_profile_status": "false",
+    "include_company_public_url": "false"
+})
+
+# Feltene fra profilen som brukes i analysen, resten kastes før caching
+LINKEDIN_FIELDS = frozenset({
+    "full_name", "headline", "about", "summary", "profile_pic_url",
+    "city", "country", "location", "industry", "company_industry",
+    "current_company", "current_job_title", "company", "job_title",
+    "experiences", "education", "educations", "skills", "languages",
+    "connections", "connection_count", "follower_count",
+})
+
+# Headerne er like for alle LinkedIn-kall
+LINKEDIN_HEADERS = {
+    'X-RapidAPI-Key': os.getenv('RAPIDAPI_KEY', ''),
+    'X-RapidAPI-Host': 'fresh-linkedin-profile-data.p.rapidapi.com'
+}
+
+async def close_http_client() -> None:
+    """Lukker HTTP-klienten for loopen som kjører, kalles av den som eier loopen"""
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def _linkedin_cache_key(linkedin_url: str) -> str:
+    """Cache-nøkkel basert på URL og scraper-versjon"""
+    return hashlib.sha256(f"{LINKEDIN_SCRAPER_VERSION}:{linkedin_url}".encode()).hexdigest()
+
+@traceable(run_type="tool", name="linkedin")
+async def get_linkedin_profile(linkedin_url: str, bypass_cache: bool = False) -> Dict:
+    """Henter LinkedIn profil data via RapidAPI, med disk-cache."""
+    cache_key = _linkedin_cache_key(linkedin_url)
+    if not (bypass_cache or CACHE_DISABLED):
+        cached = linkedin_memory_cache.get(cache_key)
+        if cached is None:
+            # diskcache er synkron, så disk-I/O kjøres utenfor event-loopen
+            cached = await asyncio.to_thread(linkedin_cache.get, cache_key)
+            if cached is not None:
+                linkedin_memory_cache[cache_key] = cached
+        if cached is not None:
+            return cached
+
     try:
-        response = requests.get(
+        response = await _get(
             "https://fresh-linkedin-profile-data.p.rapidapi.com/get-linkedin-profile",
-            params={
-                "linkedin_url": linkedin_url,
-                "include_skills": "false",
-                "include_certifications": "false",
-                "include_publications": "false",
-                "include_honors": "false",
-                "include_volunteers": "false",
-                "include_projects": "false",
-                "include_patents": "false",
-                "include_courses": "false",
-                "include_organizations": "false",
-                "include_profile_status": "false",
-                "include_company_public_url": "false"
-            },
-            headers=headers
+            linkedin_limiter,
+            params={"linkedin_url": linkedin_url, **LINKEDIN_BASE_PARAMS},
+            headers=LINKEDIN_HEADERS
         )
-        response.raise_for_status()
-        return {"data": response.json()["data"]}  # Wrap i data-felt
+        data = {
+            key: value
+            for key, value in orjson.loads(response.content)["data"].items()
+            if key in LINKEDIN_FIELDS
+        }
+        if not CACHE_DISABLED:
+            await asyncio.to_thread(linkedin_cache.set, cache_key, data, expire=LINKEDIN_CACHE_TTL)
+            linkedin_memory_cache[cache_key] = data
+        return data
         
-    except requests.RequestException as e:
-        raise LinkedInAPIError(f"LinkedIn API error: {str(e)}")
+    except httpx.HTTPError as e:
+        raise LinkedInAPIError(f"LinkedIn API error: {str(e)}") from e
+    except (orjson.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+        # Svar uten gyldig JSON eller uten data-objekt
+        raise LinkedInAPIError(f"LinkedIn API error: invalid response: {e!r}") from e
 
 # Definer LinkedIn tool
 linkedin_tool = StructuredTool(
     name="linkedin",
     description="Henter LinkedIn data",
-    func=get_linkedin_profile,
+    coroutine=get_linkedin_profile,
     args_schema=LinkedInInput
 )
 
-def get_hunter_data(domain: str, api_key: str, offset: int = 0, limit: int = 50) -> Dict:
-    """Henter brukerdata fra Hunter.io API med paginering."""
+def _without_api_key(inputs: Dict) -> Dict:
+    """Holder Hunter-nøkkelen utenfor LangSmith-tracene"""
+    return {k: v for k, v in inputs.items() if k != "api_key"}
+
+@traceable(run_type="tool", name="hunter", process_inputs=_without_api_key)
+async def get_hunter_data(
+    domain: str,
+    api_key: str,
+    offset: int = 0,
+    limit: int = 50,
+    bypass_cache: bool = False
+) -> Dict:
+    """Henter brukerdata fra Hunter.io API med paginering, med minne-cache."""
+    cache_key = (domain, offset, limit)
+    if not (bypass_cache or CACHE_DISABLED):
+        cached = hunter_memory_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
     try:
-        response = requests.get(
+        response = await _get(
             "https://api.hunter.io/v2/domain-search",
+            hunter_limiter,
             params={
                 "domain": domain,
                 "api_key": api_key,
@@ -70,26 +226,36 @@ def get_hunter_data(domain: str, api_key: str, offset: int = 0, limit: int = 50)
                 "limit": limit
             }
         )
-        response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         
-        # Valider og strukturer responsen
-        return HunterResponse(
-            emails=data["data"]["emails"],
-            meta={
+        # Strukturer responsen - valideres mot HunterResponse i agenten
+        page = {
+            "emails": data["data"]["emails"],
+            "meta": {
                 "total": data["meta"]["results"],
                 "offset": offset,
                 "limit": limit
             }
-        ).dict()
+        }
+        if not CACHE_DISABLED:
+            hunter_memory_cache[cache_key] = page
+        return page
         
-    except requests.RequestException as e:
-        raise HunterAPIError(f"Hunter API error: {str(e)}")
+    except httpx.HTTPError as e:
+        # str(e) inneholder URL-en med api_key, og feilen havner i meldingene fra API-et
+        if isinstance(e, httpx.HTTPStatusError):
+            detail = f"HTTP {e.response.status_code} {e.response.reason_phrase}"
+        else:
+            detail = type(e).__name__
+        raise HunterAPIError(f"Hunter API error: {detail}") from e
+    except (orjson.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+        # Svar uten gyldig JSON eller med uventet struktur
+        raise HunterAPIError(f"Hunter API error: invalid response: {e!r}") from e
 
 # Oppdater Hunter tool
 hunter_tool = StructuredTool(
     name="hunter",
     description="Henter kontaktinfo",
-    func=get_hunter_data,
+    coroutine=get_hunter_data,
     args_schema=HunterInput
 ) 
\ No newline at end of file